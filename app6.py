@@ -1,6 +1,8 @@
+import io
+from types import MappingProxyType
+
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import plotly.express as px
 
 # -------------------------------------------------
@@ -20,6 +22,171 @@ Upload the dataset below, map the correct columns in the sidebar, and then use t
 """
 )
 
+# -------------------------------------------------
+# State name -> abbreviation mapping for the map
+# -------------------------------------------------
+STATE_ABBREV = MappingProxyType({
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR",
+    "California": "CA", "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE",
+    "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID",
+    "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
+    "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
+    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
+    "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
+    "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
+    "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
+    "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI",
+    "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX",
+    "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
+    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
+    "District of Columbia": "DC", "D.C.": "DC"
+})
+# Series form lets pandas do the lookup as an index join instead of dict probes.
+# Keyed on casefolded names so "new york" / "NEW YORK" still land on the map.
+STATE_ABBREV_SER = pd.Series(
+    list(STATE_ABBREV.values()), index=[name.casefold() for name in STATE_ABBREV]
+)
+# Casefolded name/alias -> canonical spelling (first name listed for each code),
+# so "new york " and "D.C." group together with "New York" / "District of Columbia"
+_CANONICAL_BY_CODE = {}
+for _name, _code in STATE_ABBREV.items():
+    _CANONICAL_BY_CODE.setdefault(_code, _name)
+STATE_NAME_SER = pd.Series(
+    [_CANONICAL_BY_CODE[code] for code in STATE_ABBREV.values()], index=STATE_ABBREV_SER.index
+)
+
+# -------------------------------------------------
+# Cached loading / cleaning
+# -------------------------------------------------
+@st.cache_data(max_entries=4, ttl="1h")
+def load_dataset(name, data):
+    """Parse the uploaded bytes once; reruns reuse the cached DataFrame."""
+    if name.lower().endswith(".csv"):
+        # Arrow's multithreaded reader, falling back to the default parser
+        try:
+            return pd.read_csv(io.BytesIO(data), engine="pyarrow")
+        except ImportError:
+            return pd.read_csv(io.BytesIO(data))
+    # calamine's Rust reader handles both .xlsx and .xls; openpyxl is only a fallback
+    try:
+        return pd.read_excel(io.BytesIO(data), engine="calamine")
+    except ImportError:
+        return pd.read_excel(io.BytesIO(data))
+
+@st.cache_data(max_entries=8)
+def prepare(df, state_col, pop_col, pov_col, mil_col):
+    """Clean the mapped columns and derive rates; returns (df_map, by_state, all_states)."""
+    # Numeric conversions (assign builds a new frame, leaving the cached input untouched);
+    # infinite counts are treated as missing so they can't leak into the per-state sums
+    df = df.assign(**{
+        col: pd.to_numeric(df[col], errors="coerce").replace([float("inf"), float("-inf")], float("nan"))
+        for col in [pop_col, pov_col, mil_col]
+    })
+
+    # Drop rows missing key info
+    df_clean = df.dropna(subset=[state_col, pop_col, pov_col, mil_col])
+
+    # Narrow dtypes: integral counts get the smallest int type, anything else float32
+    narrowed = {}
+    for col in [pop_col, pov_col, mil_col]:
+        values = pd.to_numeric(df_clean[col], downcast="integer")
+        narrowed[col] = values if pd.api.types.is_integer_dtype(values) else values.astype("float32")
+
+    # Strip whitespace and fold known states onto one spelling before grouping
+    names = df_clean[state_col].astype(str).str.strip()
+    names = names.str.casefold().map(STATE_NAME_SER).fillna(names)
+
+    # Categorical states: categories come out unique and sorted, once per upload
+    narrowed[state_col] = names.astype("category")
+    df_clean = df_clean.assign(**narrowed)
+    all_states = df_clean[state_col].cat.categories.tolist()
+
+    # One row per state; rates come from summed counts so duplicate rows aggregate correctly
+    by_state = df_clean.groupby(state_col, as_index=False, observed=True)[[pop_col, pov_col, mil_col]].sum()
+    # groupby sums widen the narrowed ints as needed, so totals can't overflow; ratios stay
+    # float64 so the 6-decimal densities and 2-decimal percentages print exactly
+    pop = by_state[pop_col].astype("float64")
+    by_state = by_state.assign(
+        Millionaire_Density=by_state[mil_col].astype("float64") / pop,
+        Poverty_Rate=by_state[pov_col].astype("float64") / pop,
+        state_code=by_state[state_col].astype(str).str.casefold().map(STATE_ABBREV_SER),
+    )
+    df_map = by_state.dropna(subset=["state_code"])
+
+    return df_map, by_state, all_states
+
+@st.cache_data(max_entries=16)
+def build_choropleth(df_map, state_col, pop_col, mil_col):
+    """Build the millionaire-density map once per distinct df_map."""
+    fig = px.choropleth(
+        df_map,
+        locations="state_code",
+        locationmode="USA-states",
+        color="Millionaire_Density",
+        scope="usa",
+        hover_name=state_col,
+        hover_data={
+            state_col: True,
+            pop_col: True,
+            mil_col: True,
+            "Millionaire_Density": ":.6f"
+        },
+        color_continuous_scale="Viridis",
+        labels={"Millionaire_Density": "Millionaire Density"}
+    )
+
+    fig.update_layout(
+        title_text="Millionaire Density by U.S. State",
+        geo=dict(showlakes=True, lakecolor="lightblue")
+    )
+
+    return fig
+
+@st.cache_data(max_entries=16)
+def tab1_agg(by_state, selected, state_col, pov_col, mil_col):
+    """Per-state poverty/millionaire counts for the selected states."""
+    return by_state[by_state[state_col].isin(selected)].set_index(state_col)[[pov_col, mil_col]]
+
+@st.cache_data(max_entries=16)
+def tab2_interpretation(df_map, state_col):
+    """Top/bottom millionaire-density states as short text lists."""
+    # Partial selection instead of a full sort; bottom listed highest-to-lowest as before
+    top_states = df_map.nlargest(3, "Millionaire_Density")[[state_col, "Millionaire_Density"]]
+    bottom_states = df_map.nsmallest(3, "Millionaire_Density")[[state_col, "Millionaire_Density"]].iloc[::-1]
+
+    # Build simple text
+    top_text = (
+        top_states[state_col].astype(str) + " ("
+        + top_states["Millionaire_Density"].map("{:.6f}".format) + ")"
+    ).str.cat(sep=", ")
+    bottom_text = (
+        bottom_states[state_col].astype(str) + " ("
+        + bottom_states["Millionaire_Density"].map("{:.6f}".format) + ")"
+    ).str.cat(sep=", ")
+
+    return top_text, bottom_text
+
+@st.cache_data(max_entries=16)
+def tab3_interpretation(rate_df, state_col):
+    """Highest/lowest poverty-rate states from the already-sorted rate_df."""
+    top_high = rate_df.head(3)
+    top_low = rate_df.tail(3)
+
+    high_text = (
+        top_high[state_col].astype(str) + " ("
+        + (top_high["Poverty_Rate"] * 100).map("{:.1f}%".format) + ")"
+    ).str.cat(sep=", ")
+    low_text = (
+        top_low[state_col].astype(str) + " ("
+        + (top_low["Poverty_Rate"] * 100).map("{:.1f}%".format) + ")"
+    ).str.cat(sep=", ")
+
+    return high_text, low_text
+
+# Only serialize the rows we actually show
+def st_df_capped(df, max_rows=200):
+    st.dataframe(df.head(max_rows), width="stretch")
+
 # -------------------------------------------------
 # File uploader (used for all questions)
 # -------------------------------------------------
@@ -32,14 +199,10 @@ if uploaded_file is None:
     st.info("Upload your Poverty/Millionaire dataset to begin.")
     st.stop()
 
-filename = uploaded_file.name.lower()
-if filename.endswith(".csv"):
-    df = pd.read_csv(uploaded_file)
-else:
-    df = pd.read_excel(uploaded_file)
+df = load_dataset(uploaded_file.name, uploaded_file.getvalue())
 
 st.subheader("Dataset Preview")
-st.dataframe(df.head())
+st_df_capped(df, max_rows=5)
 
 # -------------------------------------------------
 # Column mapping in sidebar (so it works with any column names)
@@ -81,39 +244,16 @@ st.sidebar.write("Make sure each mapping matches the correct fields in your data
 # -------------------------------------------------
 # Basic cleaning / conversions
 # -------------------------------------------------
-# Numeric conversions
-for col in [population_col, poverty_col, millionaire_col]:
-    df[col] = pd.to_numeric(df[col], errors="coerce")
-
-# Drop rows missing key info
-df_clean = df.dropna(subset=[state_col, population_col, poverty_col, millionaire_col]).copy()
-
-# Precompute rates for later
-df_clean["Millionaire_Density"] = df_clean[millionaire_col] / df_clean[population_col]
-df_clean["Poverty_Rate"] = df_clean[poverty_col] / df_clean[population_col]
-
-# -------------------------------------------------
-# State name -> abbreviation mapping for the map
-# -------------------------------------------------
-STATE_ABBREV = {
-    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR",
-    "California": "CA", "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE",
-    "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID",
-    "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
-    "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
-    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
-    "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
-    "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
-    "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
-    "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI",
-    "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX",
-    "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
-    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
-    "District of Columbia": "DC", "D.C.": "DC"
-}
+# Each mapping needs its own column; overlaps are common while editing the sidebar
+mapped_cols = [state_col, population_col, poverty_col, millionaire_col]
+if len(set(mapped_cols)) < len(mapped_cols):
+    st.warning(
+        "Each column mapping must point to a different column. "
+        "Adjust the sidebar selections to continue."
+    )
+    st.stop()
 
-df_clean["state_code"] = df_clean[state_col].map(STATE_ABBREV)
-df_map = df_clean.dropna(subset=["state_code"]).copy()
+df_map, by_state, all_states = prepare(df, state_col, population_col, poverty_col, millionaire_col)
 
 # -------------------------------------------------
 # Tabs for Q4
@@ -125,11 +265,11 @@ tab1, tab2, tab3 = st.tabs(
 # =================================================
 # Tab 1 – Q1: Poverty vs Millionaire population (side-by-side bar chart)
 # =================================================
-with tab1:
+@st.fragment
+def render_tab1(all_states, by_state, state_col, poverty_col, millionaire_col):
     st.header("Poverty vs Millionaire Population by State")
 
     # Multiselect at least 5 states
-    all_states = sorted(df_clean[state_col].unique().tolist())
     selected_states = st.multiselect(
         "Select at least 5 states to compare:",
         options=all_states,
@@ -142,33 +282,28 @@ with tab1:
         if len(selected_states) < 5:
             st.info("Assignment requirement: use at least **5** states, but the chart will still render.")
 
-        subset = df_clean[df_clean[state_col].isin(selected_states)].copy()
-
-        # Group (in case there are multiple rows per state)
-        grouped = subset.groupby(state_col)[[poverty_col, millionaire_col]].sum()
+        # Already grouped per state in prepare(); sorted tuple keeps the cache key order-independent
+        grouped = tab1_agg(
+            by_state, tuple(sorted(selected_states)), state_col, poverty_col, millionaire_col
+        )
 
         st.write("Total population in poverty vs millionaires for selected states:")
         display_df = grouped.rename(
             columns={poverty_col: "Number in Poverty", millionaire_col: "Number of Millionaires"}
         ).reset_index()
-        st.dataframe(display_df)
+        st_df_capped(display_df)
 
-        # Side-by-side bar chart with Matplotlib
-        states_idx = range(len(grouped))
-        width = 0.4
-
-        fig1, ax1 = plt.subplots()
-        ax1.bar([i - width/2 for i in states_idx], grouped[poverty_col], width=width, label="In Poverty")
-        ax1.bar([i + width/2 for i in states_idx], grouped[millionaire_col], width=width, label="Millionaires")
-
-        ax1.set_xticks(list(states_idx))
-        ax1.set_xticklabels(grouped.index, rotation=45, ha="right")
-        ax1.set_xlabel("State")
-        ax1.set_ylabel("Number of People")
-        ax1.set_title("Poverty vs Millionaire Population (Selected States)")
-        ax1.legend()
-
-        st.pyplot(fig1)
+        # Side-by-side bar chart (rendered client-side by Vega-Lite)
+        chart_df = grouped.rename(
+            columns={poverty_col: "In Poverty", millionaire_col: "Millionaires"}
+        )
+        st.subheader("Poverty vs Millionaire Population (Selected States)")
+        st.bar_chart(
+            chart_df,
+            x_label="State",
+            y_label="Number of People",
+            stack=False,
+        )
 
         # Interpretation
         st.markdown(
@@ -181,10 +316,14 @@ This helps illustrate how uneven wealth distribution can be across different sta
 """
         )
 
+with tab1:
+    render_tab1(all_states, by_state, state_col, poverty_col, millionaire_col)
+
 # =================================================
 # Tab 2 – Q2: Millionaire Density Map (choropleth)
 # =================================================
-with tab2:
+@st.fragment
+def render_tab2(df_map, state_col, population_col, millionaire_col):
     st.header("Millionaire Density by U.S. State")
 
     if df_map.empty:
@@ -194,44 +333,13 @@ with tab2:
         )
     else:
         # Choropleth map
-        fig2 = px.choropleth(
-            df_map,
-            locations="state_code",
-            locationmode="USA-states",
-            color="Millionaire_Density",
-            scope="usa",
-            hover_name=state_col,
-            hover_data={
-                state_col: True,
-                population_col: True,
-                millionaire_col: True,
-                "Millionaire_Density": ":.6f"
-            },
-            color_continuous_scale="Viridis",
-            labels={"Millionaire_Density": "Millionaire Density"}
-        )
-
-        fig2.update_layout(
-            title_text="Millionaire Density by U.S. State",
-            geo=dict(showlakes=True, lakecolor="lightblue")
+        st.plotly_chart(
+            build_choropleth(df_map, state_col, population_col, millionaire_col),
+            width="stretch"
         )
 
-        st.plotly_chart(fig2, use_container_width=True)
-
         # Interpretation: highlight top and bottom states by density
-        dens_sorted = df_map.sort_values("Millionaire_Density", ascending=False)
-        top_states = dens_sorted.head(3)[[state_col, "Millionaire_Density"]]
-        bottom_states = dens_sorted.tail(3)[[state_col, "Millionaire_Density"]]
-
-        # Build simple text
-        top_text = ", ".join(
-            f"{row[state_col]} ({row['Millionaire_Density']:.6f})"
-            for _, row in top_states.iterrows()
-        )
-        bottom_text = ", ".join(
-            f"{row[state_col]} ({row['Millionaire_Density']:.6f})"
-            for _, row in bottom_states.iterrows()
-        )
+        top_text, bottom_text = tab2_interpretation(df_map, state_col)
 
         st.markdown(
             f"""
@@ -245,45 +353,40 @@ and how millionaire concentration does **not** always line up with overall popul
 """
         )
 
+with tab2:
+    render_tab2(df_map, state_col, population_col, millionaire_col)
+
 # =================================================
 # Tab 3 – Q3: Poverty Rate comparison (horizontal bar chart)
 # =================================================
-with tab3:
+@st.fragment
+def render_tab3(by_state, state_col):
     st.header("Poverty Rate Across States")
 
-    if df_clean.empty:
+    if by_state.empty:
         st.warning("No valid data available to compute poverty rates.")
     else:
-        rate_df = df_clean[[state_col, "Poverty_Rate"]].dropna().drop_duplicates()
+        rate_df = by_state[[state_col, "Poverty_Rate"]].dropna()
         rate_df = rate_df.sort_values("Poverty_Rate", ascending=False)
 
         st.write("Poverty rate by state:")
-        rate_display = rate_df.copy()
-        rate_display["Poverty_Rate (%)"] = rate_display["Poverty_Rate"] * 100
-        st.dataframe(rate_display[[state_col, "Poverty_Rate (%)"]])
-
-        # Horizontal bar chart
-        fig3, ax3 = plt.subplots(figsize=(8, max(4, len(rate_df) * 0.2)))
-        ax3.barh(rate_df[state_col], rate_df["Poverty_Rate"] * 100)
-        ax3.set_xlabel("Poverty Rate (%)")
-        ax3.set_ylabel("State")
-        ax3.set_title("Poverty Rate by State (Highest to Lowest)")
-        plt.gca().invert_yaxis()  # highest at top
-
-        st.pyplot(fig3)
+        rate_display = rate_df.assign(**{"Poverty_Rate (%)": rate_df["Poverty_Rate"] * 100})
+        st_df_capped(rate_display[[state_col, "Poverty_Rate (%)"]].round(2))
+
+        # Horizontal bar chart, highest rate at the top
+        chart_rate = (rate_df.set_index(state_col)["Poverty_Rate"] * 100).rename("Poverty Rate (%)")
+        st.subheader("Poverty Rate by State (Highest to Lowest)")
+        st.bar_chart(
+            chart_rate,
+            x_label="State",
+            y_label="Poverty Rate (%)",
+            horizontal=True,
+            sort="-Poverty Rate (%)",
+            height=max(300, len(rate_df) * 20),
+        )
 
         # Interpretation
-        top_high = rate_df.head(3)
-        top_low = rate_df.tail(3)
-
-        high_text = ", ".join(
-            f"{row[state_col]} ({row['Poverty_Rate']*100:.1f}%)"
-            for _, row in top_high.iterrows()
-        )
-        low_text = ", ".join(
-            f"{row[state_col]} ({row['Poverty_Rate']*100:.1f}%)"
-            for _, row in top_low.iterrows()
-        )
+        high_text, low_text = tab3_interpretation(rate_df, state_col)
 
         st.markdown(
             f"""
@@ -295,3 +398,6 @@ You can discuss how these differences might connect to regional economies, cost
 and policy choices that affect income support, jobs, and education.
 """
         )
+
+with tab3:
+    render_tab3(by_state, state_col)